@@ -1,13 +1,29 @@
+import asyncio
+import hashlib
+import importlib.util
 import mmap
 import os
+import time
 import contextlib
+from base64 import b64encode
 from tempfile import NamedTemporaryFile
-from multiprocessing import Pool, current_process
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from urllib.parse import urlparse
-from io import BytesIO
+from io import BufferedReader
 
-import botocore
-import boto3
+# boto3 costs hundreds of ms to import and optional dependencies should
+# not be required, so anything heavy is imported inside the functions
+# needing it and only probed for here
+from s3pd.backends import s5cmd
+
+def has_module(name):
+    """Return whether a module is installed, without importing it.
+
+    :param name: Name of the module to probe for.
+    :return: `True` when the module can be imported.
+    """
+    return importlib.util.find_spec(name) is not None
 
 
 LINK_SENTINEL = '#S3LINK#'
@@ -17,21 +33,45 @@ def shm_file(size, destination):
     """Create a named shared memory and return its file object.
 
     :param size: Size of the file to create, in bytes.
-    :param destination: Path of the file to create, or `None` to create a
-        temporary file in /dev/shm.
+    :param destination: Path of the file to create, or `None` to create an
+        anonymous memory file (or a temporary file in /dev/shm when
+        `memfd_create` is not available).
     :return: A tuple `(file object, path)` to be used from a context manager.
     """
     if destination:
         with open(destination, 'w+b') as shmfile:
             os.truncate(shmfile.fileno(), size)
+            fadvise_sequential(shmfile.fileno(), size)
             shmfile.seek(0)
             yield shmfile, destination
+    elif hasattr(os, 'memfd_create'):
+        # An anonymous memory file skips the tmpfs VFS entry entirely,
+        # yet keeps an fd whose /proc path can be handed to `func`
+        fd = os.memfd_create('s3pd', os.MFD_CLOEXEC)
+        with os.fdopen(fd, 'w+b') as shmfile:
+            os.truncate(fd, size)
+            fadvise_sequential(fd, size)
+            yield shmfile, '/proc/self/fd/%d' % fd
     else:
         with NamedTemporaryFile(mode='wb', prefix='s3-', dir='/dev/shm') as shmfile:
             os.truncate(shmfile.fileno(), size)
+            fadvise_sequential(shmfile.fileno(), size)
             shmfile.seek(0)
             yield shmfile, shmfile.name
 
+def fadvise_sequential(fileno, size):
+    """Hint the kernel that the file will be written sequentially.
+
+    No-op on platforms without `posix_fadvise` (e.g. macOS).
+
+    :param fileno: File descriptor of the file to advise on.
+    :param size: Size of the file, in bytes.
+    """
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(
+            fileno, 0, size,
+            os.POSIX_FADV_SEQUENTIAL | os.POSIX_FADV_WILLNEED)
+
 @contextlib.contextmanager
 def shm_map(fileno, offset, size):
     """Create a memory map of a file or shared memory and return it.
@@ -64,117 +104,362 @@ def get_filesize(client, bucket, key, version=None):
     return client.head_object(**args)['ContentLength']
 
 def create_chunks(chunksize, filesize):
-    """Generate list of constant size chunks from a filesize.
+    """Generate constant size chunks from a filesize.
 
     The chunksize should be a multiple of mmap.ALLOCATIONGRANULARITY (most
     likely 4KB). Example:
 
-        >>> create_chunks(5, 12)
+        >>> list(create_chunks(5, 12))
         [(0, 4), (5, 9), (10, 11)]
 
     :param chunksize: Desired chunk size, in bytes.
     :param filesize: Provided file size, in bytes.
-    :return: A list of tuples `(offset first, offset last)` for every chunk
-        of the file. Each offset will have exactly the same size (`chunksize`)
-        except of course the last one if the file size is not divisible by
-        the chunk size.
+    :return: An iterator of tuples `(offset first, offset last)` for every
+        chunk of the file. Each offset will have exactly the same size
+        (`chunksize`) except of course the last one if the file size is not
+        divisible by the chunk size.
     """
-    return [
-        (i, min(i+chunksize-1, filesize-1)) for i in range(0, filesize, chunksize)]
+    return (
+        (i, min(i+chunksize-1, filesize-1))
+        for i in range(0, filesize, chunksize))
+
+def create_client(signed=True, pool_connections=None):
+    """Create a boto client tuned for many concurrent range requests.
 
-def create_client(signed=True):
-    """Create a boto client.
+    The connection pool is sized for the download concurrency so range
+    requests reuse kept-alive connections instead of paying a DNS lookup
+    and TLS handshake each.
 
     :param signed: If `False` return a client not signing requests.
+    :param pool_connections: Size of the HTTP connection pool, default to
+        `max(32, 4*cpus)`. Should match the number of concurrent
+        downloads to avoid tearing down keep-alive connections.
     :return: The `boto3.Client`.
     """
-    if signed:
-        return boto3.client('s3')
-    else:
-        return boto3.client(
-            's3',
-            config=botocore.config.Config(signature_version=botocore.UNSIGNED))
-
-def download_chunk(
-        bucket, key, shmfileno, offset_first, offset_last, signed, version=None):
-    """Worker function to download a chunk of the file.
+    import boto3
+    import botocore.config
+
+    config = botocore.config.Config(
+        max_pool_connections=(
+            pool_connections or max(32, (os.cpu_count() or 1)*4)),
+        tcp_keepalive=True,
+        retries={'max_attempts': 3, 'mode': 'standard'},
+        **({'signature_version': botocore.UNSIGNED} if not signed else {}))
+    return boto3.client('s3', config=config)
+
+def open_body(client, bucket, key, offset_first, offset_last, version=None):
+    """Issue a byte-range GET and return a `readinto`-capable reader.
+
+    The body is wrapped in an `io.BufferedReader` so the TLS socket is
+    drained in large coalesced blocks instead of one small read per
+    call, and so reads stay on the public API: urllib3 owns the read
+    accounting that releases connections back to the keep-alive pool,
+    and the response chain must stay referenced or its finalizer closes
+    the socket from under us.
 
+    :param client: The client to use for performing the query.
     :param bucket: Name of the S3 bucket.
     :param key: Path inside the bucket (without leading `/`)
-    :param shmfileno: File descriptor for an opened destination file.
-    :param offset_first: Start position of the chunk to download.
-    :param offset_last: Last position of the chunk to download.
+    :param offset_first: Start position of the range to download.
+    :param offset_last: Last position of the range to download.
     :param version: The file version to retrieve, or None
-    :return: Nothing, the chunk is directly copied in the destination file.
+    :return: A reader exposing `readinto`.
     """
-    client = create_client(signed)
     args = {
         'Bucket': bucket,
         'Key': key,
         'Range': 'bytes=%s-%s' % (offset_first, offset_last),
         **({'VersionId': version} if version else {}),
     }
-    with shm_map(shmfileno, offset_first, offset_last - offset_first + 1) as shmmap:
-        chunk = client.get_object(**args)['Body']
-        chunk._raw_stream.readinto(shmmap)
-
+    body = client.get_object(**args)['Body']
+    return BufferedReader(body, buffer_size=1024*1024)
 
-def resolve_link(bucket, key, client, depth=10):
-    """Resolve S3 links to target key.
+def download_chunk(
+        client, bucket, key, shmfileno, offset_first, offset_last,
+        version=None, drop_pages=False, checksum=False, use_pwrite=False):
+    """Worker function to download a chunk of the file.
 
+    :param client: The client to use for performing the query.
     :param bucket: Name of the S3 bucket.
     :param key: Path inside the bucket (without leading `/`)
-    :param client: boto3 client to use when performing requests.
-    :param depth: Maximum number of link indirections before stopping.
+    :param shmfileno: File descriptor for an opened destination file.
+    :param offset_first: Start position of the chunk to download.
+    :param offset_last: Last position of the chunk to download.
+    :param version: The file version to retrieve, or None
+    :param drop_pages: If `True`, advise the kernel to drop the written
+        pages once the chunk is complete. Only useful when nothing will
+        read the pages back.
+    :param checksum: If `True`, hash the bytes as they are written rather
+        than in a separate pass once the download is done.
+    :param use_pwrite: If `True`, write through a small staging buffer
+        with `os.pwrite` instead of an mmap. Faulting and dirtying mapped
+        pages is more expensive than plain positioned writes on ordinary
+        filesystems; mmap stores only win on tmpfs.
+    :return: The SHA256 digest of the chunk when `checksum` is set, else
+        None. The chunk itself is directly copied in the destination file.
     """
-    # Stop after too many link indirections
-    assert depth > 0, 'Too many levels of link indirections'
+    import botocore.exceptions
+
+    digest = hashlib.sha256() if checksum else None
+    size = offset_last - offset_first + 1
 
-    new_bucket, new_key = check_link_target(bucket, key, client)
-    if new_bucket == bucket and new_key == key:
-        return new_bucket, new_key
+    with contextlib.ExitStack() as stack:
+        if use_pwrite:
+            staging = memoryview(bytearray(min(1024*1024, size)))
+        else:
+            shmmap = stack.enter_context(
+                shm_map(shmfileno, offset_first, size))
+            view = stack.enter_context(memoryview(shmmap))
+
+        reader = open_body(
+            client, bucket, key, offset_first, offset_last, version=version)
+        written = 0
+        retries = 0
+        while written < size:
+            # Sub-views are released as soon as each iteration ends,
+            # a lingering export would make the mmap close fail
+            with (staging[:min(len(staging), size-written)] if use_pwrite
+                    else view[written:]) as buffer:
+                try:
+                    read = reader.readinto(buffer)
+                except (ValueError, OSError,
+                        botocore.exceptions.BotoCoreError):
+                    # ValueError is what a stream closed under us raises
+                    read = 0
+                if not read:
+                    # Connection dropped or the response ended short,
+                    # leave no silent hole of zeroes: reissue the
+                    # remainder of the range after an exponential backoff
+                    assert retries < 5, \
+                        'Chunk download failed after 5 retries'
+                    time.sleep(0.1 * 2**retries)
+                    retries += 1
+                    reader = open_body(
+                        client, bucket, key, offset_first + written,
+                        offset_last, version=version)
+                    continue
+                if digest:
+                    digest.update(buffer[:read])
+                if use_pwrite:
+                    os.pwrite(
+                        shmfileno, buffer[:read], offset_first + written)
+                written += read
+
+        if drop_pages:
+            if not use_pwrite and hasattr(mmap, 'MADV_DONTNEED'):
+                shmmap.madvise(mmap.MADV_DONTNEED)
+            if hasattr(os, 'posix_fadvise'):
+                # Start writeback of this range now so it overlaps with
+                # the chunks still downloading instead of piling up for
+                # one big flush at close time
+                os.posix_fadvise(
+                    shmfileno, offset_first, size, os.POSIX_FADV_DONTNEED)
+
+    return digest.digest() if digest else None
+
+
+def verify_checksum(expected, digests):
+    """Check per-chunk SHA256 digests against the object checksum.
+
+    S3 reports either a plain SHA256 for single-part uploads or a
+    composite `b64(sha256(concat(part digests)))-N` for multipart ones.
+    Plain checksums can only be checked when the file was fetched in a
+    single chunk, composite ones only when the caller made sure the
+    chunk boundaries match the upload part boundaries (see the part
+    layout check in `s3pd`); other combinations are silently skipped
+    since the digests cannot be recombined.
+
+    :param expected: The `ChecksumSHA256` value reported by S3, or None.
+    :param digests: Per-chunk SHA256 digests, in file order.
+    :return: Nothing, fails on checksum mismatch.
+    """
+    if not expected:
+        return
+
+    if '-' in expected:
+        parts = int(expected.rsplit('-', 1)[1])
+        if parts != len(digests):
+            return
+        combined = hashlib.sha256(b''.join(digests)).digest()
+        actual = '%s-%s' % (b64encode(combined).decode(), parts)
+    elif len(digests) == 1:
+        actual = b64encode(digests[0]).decode()
+    else:
+        return
 
-    return resolve_link(
-        bucket=new_bucket,
-        key=new_key,
-        client=client,
-        depth=depth-1)
+    assert actual == expected, \
+        'SHA256 checksum mismatch: %s != %s' % (actual, expected)
 
 
-def check_link_target(bucket, key, client):
-    filesize = get_filesize(client, bucket, key)
-    if filesize > 1024:
-        return bucket, key
+def verify_crc32c(expected, path):
+    """Check a downloaded file against the stored CRC32C checksum.
 
-    with BytesIO() as stream:
-        client.download_fileobj(Bucket=bucket, Key=key, Fileobj=stream)
-        # In case decoding utf-8 fails, then we are not in a presence of a link
+    CRC32C values of separate ranges cannot be recombined with the
+    google-crc32c wheel, so the file is re-read once. The SIMD
+    implementation runs at several GB/s per core, far above download
+    rates, so the extra pass is cheap.
+
+    :param expected: The `ChecksumCRC32C` value reported by S3.
+    :param path: Path of the downloaded file.
+    :return: Nothing, fails on checksum mismatch.
+    """
+    import google_crc32c
+
+    # Composite multipart checksums cannot be recomputed from the object
+    # bytes alone
+    if '-' in expected:
+        return
+
+    crc = google_crc32c.Checksum()
+    with open(path, 'rb') as stream:
+        while True:
+            data = stream.read(1024*1024)
+            if not data:
+                break
+            crc.update(data)
+
+    actual = b64encode(crc.digest()).decode()
+    assert actual == expected, \
+        'CRC32C checksum mismatch: %s != %s' % (actual, expected)
+
+
+async def _download_async(
+        bucket, key, shmfileno, filesize, chunks, processes, signed,
+        version=None):
+    """Download all chunks of the file from a single asyncio event loop.
+
+    One aiobotocore client multiplexes every byte-range request over a
+    shared connection pool, so concurrency is not bounded by a thread
+    count, only by the semaphore gating in-flight requests.
+
+    :param bucket: Name of the S3 bucket.
+    :param key: Path inside the bucket (without leading `/`)
+    :param shmfileno: File descriptor for an opened destination file.
+    :param filesize: Size of the file to download, in bytes.
+    :param chunks: Iterable of `(offset first, offset last)` chunk tuples.
+    :param processes: Requested download concurrency.
+    :param signed: If `False` use unsigned requests.
+    :param version: The file version to retrieve, or None
+    :return: Nothing, the chunks are directly copied in the destination file.
+    """
+    import botocore
+    import aiobotocore.session
+    from aiobotocore.config import AioConfig
+
+    semaphore = asyncio.Semaphore(processes*4)
+    config = AioConfig(
+        max_pool_connections=processes*4,
+        **({'signature_version': botocore.UNSIGNED} if not signed else {}))
+    session = aiobotocore.session.get_session()
+    async with session.create_client('s3', config=config) as client:
+        with shm_map(shmfileno, 0, filesize) as shmmap:
+            async def fetch(offset_first, offset_last):
+                async with semaphore:
+                    offset = offset_first
+                    retries = 0
+                    while offset <= offset_last:
+                        args = {
+                            'Bucket': bucket,
+                            'Key': key,
+                            'Range': 'bytes=%s-%s' % (offset, offset_last),
+                            **({'VersionId': version} if version else {}),
+                        }
+                        response = await client.get_object(**args)
+                        body = response['Body']
+                        async for data in body.iter_chunks(1024*1024):
+                            shmmap[offset:offset+len(data)] = data
+                            offset += len(data)
+                        if offset <= offset_last:
+                            # The response ended short, leave no silent
+                            # hole of zeroes: reissue the remainder of
+                            # the range after an exponential backoff
+                            assert retries < 5, \
+                                'Chunk download failed after 5 retries'
+                            await asyncio.sleep(0.1 * 2**retries)
+                            retries += 1
+
+            await asyncio.gather(*(fetch(*chunk) for chunk in chunks))
+
+
+def resolve_and_size(bucket, key, client, depth=10):
+    """Resolve S3 links to target key and return the target file size.
+
+    A single ranged `GET` of the first kilobyte returns both the total
+    object size (in `ContentRange`) and enough of the body to detect the
+    link sentinel, where a `HEAD` plus a separate download used to be
+    needed for every hop.
+
+    :param bucket: Name of the S3 bucket.
+    :param key: Path inside the bucket (without leading `/`)
+    :param client: boto3 client to use when performing requests.
+    :param depth: Maximum number of link indirections before stopping.
+    :return: A tuple `(bucket, key, filesize, head)` where `head` holds
+        the first bytes of the target file (the whole file if it is
+        smaller than 1KB).
+    """
+    while True:
+        # Stop after too many link indirections
+        assert depth > 0, 'Too many levels of link indirections'
+        depth -= 1
+
+        try:
+            response = client.get_object(
+                Bucket=bucket, Key=key, Range='bytes=0-1023')
+        except client.exceptions.ClientError as error:
+            # A ranged GET of a zero-byte object fails with InvalidRange;
+            # empty objects have nothing to size and cannot be links
+            if error.response['Error']['Code'] != 'InvalidRange':
+                raise
+            return bucket, key, 0, b''
+        filesize = int(response['ContentRange'].rsplit('/', 1)[1])
+        head = response['Body'].read()
+
+        # Links are small files, anything bigger cannot be one
+        if filesize > 1024:
+            return bucket, key, filesize, head
+
+        # In case decoding utf-8 fails, then we are not in a presence of
+        # a link
         try:
-            content = stream.getvalue().decode("utf-8").strip()
+            content = head.decode("utf-8").strip()
         except UnicodeDecodeError:
-            return bucket, key
+            return bucket, key, filesize, head
 
-    # Check whether this file is a link
-    if not content.startswith(LINK_SENTINEL):
-        return bucket, key
+        # Check whether this file is a link
+        if not content.startswith(LINK_SENTINEL):
+            return bucket, key, filesize, head
 
-    url = content[len(LINK_SENTINEL) :]
-    parsed_url = urlparse(url)
-    path = parsed_url.path
+        url = content[len(LINK_SENTINEL) :]
+        parsed_url = urlparse(url)
+        path = parsed_url.path
+
+        # In case the link url ommits the s3://bucket/ part, then
+        # assume it is a key relative to the current bucket
+        bucket = parsed_url.netloc or bucket
 
-    # In case the link url ommits the s3://bucket/ part, then
-    # assume it is a key relative to the current bucket
-    new_bucket = parsed_url.netloc or bucket
+        # S3 keys do not start with /
+        key = path if not path.startswith('/') else path[1:]
 
-    # S3 keys do not start with /
-    new_key = path if not path.startswith('/') else path[1:]
 
-    return new_bucket, new_key
+def auto_chunksize(filesize, processes):
+    """Derive a chunk size from the file size and download concurrency.
 
+    Small files are dominated by per-request API overhead and want few
+    round trips, huge files want large ranges so the number of requests
+    stays small. Aim for about 4 chunks per worker, clamped between 8MB
+    and 256MB, and round up to mmap.ALLOCATIONGRANULARITY.
+
+    :param filesize: Size of the file to download, in bytes.
+    :param processes: Number of concurrent downloads.
+    :return: The chunk size, in bytes.
+    """
+    chunksize = max(8*1024*1024, min(256*1024*1024, filesize // (processes*4)))
+    granularity = mmap.ALLOCATIONGRANULARITY
+    return (chunksize + granularity - 1) // granularity * granularity
 
 def s3pd(
-        url, processes=8, chunksize=67108864, destination=None, func=None,
-        signed=True, version=None):
+        url, processes=8, chunksize=None, destination=None, func=None,
+        signed=True, version=None, checksum=False):
     """Main entry point to download an s3 file in parallel.
 
     Example to download a file locally:
@@ -185,45 +470,155 @@ def s3pd(
 
     :param url: S3 address of the file to download, using the 's3' scheme
         such as `s3://bucket-name/file/to/download.txt`.
-    :param processes: Number of processes to use for the download, default
-        to 8. Forced to 1 if not the main process when using multiprocessing.
-    :param chunksize: Size of each chunk to download, default to 64MB.
+    :param processes: Number of download threads to use, default to 8.
+    :param chunksize: Size of each chunk to download, or `None` (the
+        default) to derive it from the file size, see `auto_chunksize`.
     :param destination: Destination path for the downloaded file, including the
         filename. If `None`, a temporary file is created in /dev/shm and you
         should provide a `func` to apply on the filename and return. This is
         useful if just want to apply a function (e.g. loading) on a remote
         file.
+    :param checksum: If `True`, hash chunks as they are downloaded and
+        verify them against the SHA256 checksum stored on S3 when one is
+        available, see `verify_checksum`.
     """
-    assert chunksize % mmap.ALLOCATIONGRANULARITY == 0
+    assert chunksize is None or chunksize % mmap.ALLOCATIONGRANULARITY == 0
 
     parsed_url = urlparse(url)
     bucket = parsed_url.netloc
     key = parsed_url.path[1:]
-    client = create_client(signed)
+    # Created once and shared by every download worker, boto3 clients
+    # are thread-safe and cost 50-200ms each to construct
+    client = create_client(signed, pool_connections=processes*2)
+
+    bucket, key, filesize, head = resolve_and_size(bucket, key, client)
+
+    # The resolution request sized the latest version, re-query when an
+    # explicit version is wanted
+    if version:
+        filesize = get_filesize(client, bucket, key, version=version)
+    if chunksize is None:
+        chunksize = auto_chunksize(filesize, processes)
+
+    # Plain download-to-destination jobs can skip the chunk workers
+    # entirely when the s5cmd binary is present; small files are not
+    # worth the extra process spawn
+    if (destination and func is None and version is None and not checksum
+            and filesize >= 2*chunksize and s5cmd.available()):
+        s5cmd.download(
+            's3://%s/%s' % (bucket, key), destination, processes,
+            signed=signed)
+        return
 
-    bucket, key = resolve_link(bucket, key, client)
-
-    filesize = get_filesize(client, bucket, key, version=version)
     chunks = create_chunks(chunksize, filesize)
 
-    # Don't fork more children than chunks
-    processes = min(processes, len(chunks))
-
-    # Prevent multiprocessing children to fork
-    if current_process().daemon:
-        processes = 1
+    # Don't spawn more threads than chunks
+    num_chunks = -(-filesize // chunksize)
+    processes = min(processes, num_chunks)
+
+    # The stored checksums to verify against, if any. SHA256 hashing
+    # happens in the chunk workers, so verification forces the thread
+    # path; CRC32C is a separate pass over the finished file
+    expected_checksum = None
+    expected_crc32c = None
+    if checksum:
+        args = {
+            'Bucket': bucket,
+            'Key': key,
+            'ChecksumMode': 'ENABLED',
+            **({'VersionId': version} if version else {}),
+        }
+        head_response = client.head_object(**args)
+        expected_checksum = head_response.get('ChecksumSHA256')
+        if expected_checksum and '-' in expected_checksum:
+            # A composite digest can only be recombined when our chunks
+            # sit exactly on the upload part boundaries, and parts are
+            # not required to be uniform: confirm every part size and
+            # skip verification unless the whole layout lines up
+            parts = []
+            try:
+                object_parts = client.get_object_attributes(
+                    Bucket=bucket, Key=key,
+                    ObjectAttributes=['ObjectParts'], MaxParts=10000,
+                    **({'VersionId': version} if version else {}),
+                ).get('ObjectParts', {})
+                if not object_parts.get('IsTruncated'):
+                    parts = [
+                        part['Size']
+                        for part in object_parts.get('Parts', [])]
+            except client.exceptions.ClientError:
+                pass
+            if (not parts
+                    or any(size != chunksize for size in parts[:-1])
+                    or parts[-1] > chunksize):
+                expected_checksum = None
+        if has_module('google_crc32c'):
+            expected_crc32c = head_response.get('ChecksumCRC32C')
+
+    # The asyncio path needs to own the event loop and only serves the
+    # in-memory staging case: disk destinations go through the thread
+    # workers for their pwrite and writeback-overlap behaviour, and
+    # hashing happens in the thread workers too
+    try:
+        asyncio.get_running_loop()
+        use_asyncio = False
+    except RuntimeError:
+        use_asyncio = (
+            destination is None and not checksum
+            and has_module('aiobotocore'))
+
+    # Once a chunk is written to an on-disk destination and nothing will
+    # read it back, its pages are only page-cache pressure
+    drop_pages = destination is not None and func is None
 
     with shm_file(filesize, destination) as (shmfile, shmfilename):
-        download_tasks = [
-            (bucket, key, shmfile.fileno(), *chunk, signed, version)
-            for chunk in chunks]
-
-        if processes == 1:
-            for task in download_tasks:
-                download_chunk(*task)
+        # Everything but the offsets is identical across chunks, bind it
+        # once so tasks are just `(offset first, offset last)` pairs
+        worker = partial(
+            download_chunk, client, bucket, key, shmfile.fileno(),
+            version=version, drop_pages=drop_pages, checksum=checksum,
+            use_pwrite=destination is not None)
+
+        digests = None
+        if version is None and filesize <= len(head):
+            # The resolution request already returned the whole file
+            shmfile.write(head)
+            shmfile.flush()
+            if checksum:
+                digests = [hashlib.sha256(head).digest()]
+        elif filesize < 2*chunksize or filesize < 8*1024*1024:
+            # Small files return in one round trip, the mmap and worker
+            # machinery is pure overhead at this size
+            args = {
+                'Bucket': bucket,
+                'Key': key,
+                **({'VersionId': version} if version else {}),
+            }
+            data = client.get_object(**args)['Body'].read()
+            shmfile.write(data)
+            shmfile.flush()
+            if checksum:
+                digests = [hashlib.sha256(data).digest()]
+        elif use_asyncio:
+            asyncio.run(_download_async(
+                bucket, key, shmfile.fileno(), filesize, chunks, processes,
+                signed, version=version))
+        elif processes == 1:
+            digests = [worker(*chunk) for chunk in chunks]
         else:
-            with Pool(processes=processes) as pool:
-                pool.starmap(download_chunk, download_tasks)
+            with ThreadPoolExecutor(max_workers=processes) as executor:
+                futures = [
+                    executor.submit(worker, *chunk)
+                    for chunk in chunks]
+                for future in as_completed(futures):
+                    future.result()
+                # Futures are in submit order, i.e. file order
+                digests = [future.result() for future in futures]
+
+        if checksum and digests:
+            verify_checksum(expected_checksum, digests)
+        if checksum and expected_crc32c:
+            verify_crc32c(expected_crc32c, shmfilename)
 
         if func:
             return func(shmfilename)
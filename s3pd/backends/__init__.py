@@ -0,0 +1 @@
+"""Optional download backends that replace the built-in chunk workers."""
@@ -0,0 +1,37 @@
+"""Delegate plain downloads to the s5cmd binary.
+
+`s5cmd <https://github.com/peak/s5cmd>`_ is a Go S3 client that performs
+its own parallel range downloads with no per-chunk interpreter overhead.
+When the binary is on PATH, download-to-destination jobs can be handed
+to it wholesale.
+"""
+import shutil
+import subprocess
+
+
+def available():
+    """Return whether the s5cmd binary is on PATH.
+
+    :return: `True` when s5cmd can be executed.
+    """
+    return shutil.which('s5cmd') is not None
+
+
+def download(url, destination, processes, signed=True):
+    """Download a file to a local path using s5cmd.
+
+    :param url: S3 address of the file to download, using the 's3' scheme.
+    :param destination: Destination path for the downloaded file,
+        including the filename.
+    :param processes: Number of concurrent download workers.
+    :param signed: If `False` use unsigned requests.
+    :return: Nothing, fails with `subprocess.CalledProcessError` when
+        s5cmd exits non-zero.
+    """
+    command = [
+        's5cmd',
+        *(['--no-sign-request'] if not signed else []),
+        '--numworkers', str(processes),
+        'cp', '--concurrency', str(processes),
+        url, destination]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
@@ -7,21 +7,56 @@ Options:
     -p,--processes=<PROCESSES>      Number of concurrent download processes
                                     [default: 4]
     -c,--chunksize=<CHUNKSIZE>      Size of chunks for each worker, in bytes
-                                    [default: 8388608]
+                                    or with a K/M/G suffix (e.g. 64M),
+                                    derived from the file size by default
+                                    [default: auto]
     -u,--unsigned                   Use unsigned requests
 """
+import mmap
+import sys
+
 from docopt import docopt
 
-from s3pd import s3pd, version
+from s3pd import version
+
+def parse_size(size):
+    """Parse a human friendly byte size such as `64M` or `1G`.
+
+    Plain integers are taken as bytes; `K`, `M` and `G` suffixes
+    (case-insensitive) multiply by powers of 1024. The result is rounded
+    up to the next multiple of mmap.ALLOCATIONGRANULARITY, with a
+    warning, since chunks must be mappable at their offset.
+
+    :param size: The size string to parse.
+    :return: The size in bytes.
+    """
+    suffixes = {'K': 1024, 'M': 1024**2, 'G': 1024**3}
+    multiplier = suffixes.get(size[-1:].upper(), 1)
+    value = int(size[:-1] if multiplier > 1 else size) * multiplier
+
+    granularity = mmap.ALLOCATIONGRANULARITY
+    rounded = (value + granularity - 1) // granularity * granularity
+    if rounded != value:
+        print(
+            'warning: chunksize rounded up to %s, the next multiple of %s'
+            % (rounded, granularity), file=sys.stderr)
+    return rounded
 
 def main():
     args = docopt(__doc__, version=version.__version__)
 
+    # Deferred so --help, --version and argument errors never pay for it
+    from s3pd import s3pd
+
     source = args['<SOURCE>']
     destination = args['<DESTINATION>']
 
     processes = int(args['--processes'])
-    chunksize = int(args['--chunksize'])
+    # Parsed and aligned before s3pd runs, so a bad size fails here
+    # instead of after the first round trip to S3
+    chunksize = (
+        None if args['--chunksize'] == 'auto'
+        else parse_size(args['--chunksize']))
     signed = not args['--unsigned']
 
     s3pd(
@@ -16,10 +16,14 @@ setup(
     description='S3 parallel downloader',
     long_description='Download files from S3 using multiple processes',
     install_requires=[
-        'boto3 >=1.7.14, <2',
-        'botocore >=1.10.14, <2',
+        'boto3 >=1.26, <2',
+        'botocore >=1.29, <2',
         'docopt >=0.6.2',
     ],
+    extras_require={
+        'async': ['aiobotocore >=2.5, <3'],
+        'crc32c': ['google-crc32c >=1.5'],
+    },
     entry_points="""
         [console_scripts]
         s3pd = s3pd.cli:main